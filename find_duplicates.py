@@ -1,55 +1,274 @@
 import os
-import sys
+import queue
+import sqlite3
 import hashlib
+import argparse
+import threading
+import multiprocessing
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-def get_file_size(path):
+IO_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+DEFAULT_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "find_duplicates.db")
+CACHE_BATCH = 1000
+HAS_FADVISE = hasattr(os, "posix_fadvise") # Нет в Windows и macOS
+HAS_FILE_DIGEST = hasattr(hashlib, "file_digest") # Python 3.11+
+SMALL_FILE_SIZE = 1024 * 1024
+SMALL_BATCH = 128
+QUEUE_SIZE = 1024
+HEAD_SIZE = 65536
+DEFAULT_MIN_SIZE = 4096
+# Процессы запускаются, когда уже работают потоки обхода и хэширования,
+# поэтому обычный fork небезопасен - используем forkserver, где он есть
+MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+def new_hasher():
+    # BLAKE2b быстрее MD5 в программной реализации и не имеет известных коллизий
+    return hashlib.blake2b(digest_size=16)
+
+def file_hash(filepath, block_size=1024 * 1024):
+    hasher = new_hasher()
+    try:
+        with open(filepath, "rb") as f:
+            # Подсказываем ядру, что файл читается целиком и последовательно
+            if HAS_FADVISE:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            # mmap не используется: если файл обрежут во время хэширования,
+            # процесс получит SIGBUS, который нельзя перехватить
+            if HAS_FILE_DIGEST:
+                # file_digest читает в переиспользуемый буфер без цикла на Python
+                hasher = hashlib.file_digest(f, new_hasher)
+            else:
+                for chunk in iter(lambda: f.read(block_size), b""):
+                    hasher.update(chunk)
+            # Прочитанный файл больше не нужен - не вытесняем им из кэша рабочие данные
+            if HAS_FADVISE:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        return filepath, hasher.hexdigest()
+    except:
+        return filepath, None
+
+def head_hash(filepath, n=HEAD_SIZE):
+    # Для файла не длиннее n это хэш всего содержимого - тот же, что дает file_hash
     try:
-        return os.path.getsize(path)
+        with open(filepath, "rb") as f:
+            data = f.read(n)
+        hasher = new_hasher()
+        hasher.update(data)
+        return filepath, hasher.hexdigest()
     except:
-        return -1
+        return filepath, None
 
-def md5(filepath, block_size=65536):
-    hash_md5 = hashlib.md5()
+def small_file_hash(filepath):
+    # Сюда попадают файлы от HEAD_SIZE до SMALL_FILE_SIZE: они читаются одним
+    # вызовом, без подсказок о последовательном чтении и цикла по блокам
     try:
         with open(filepath, "rb") as f:
-            for chunk in iter(lambda: f.read(block_size), b""):
-                hash_md5.update(chunk)
-        return filepath, hash_md5.hexdigest()
+            data = f.read()
+            # Прочитанный файл больше не нужен - не вытесняем им из кэша рабочие данные
+            if HAS_FADVISE:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        hasher = new_hasher()
+        hasher.update(data)
+        return filepath, hasher.hexdigest()
     except:
         return filepath, None
 
-def group_by_size(folder):
-    size_map = defaultdict(list)
-    for root, _, files in os.walk(folder):
-        for name in files:
-            full_path = os.path.join(root, name)
-            size = get_file_size(full_path)
-            if size >= 0:
-                size_map[size].append(full_path)
-    # Отфильтровываем только потенциальные дубликаты (одинаковый размер)
-    return [files for files in size_map.values() if len(files) > 1]
-
-def hash_groups(groups):
+def file_hash_list(filepath):
+    return [file_hash(filepath)]
+
+def hash_batch(filepaths):
+    return [small_file_hash(filepath) for filepath in filepaths]
+
+def group_by_size(folder, events, slots, min_size=0, max_size=None, with_keys=False):
+    """Обходит дерево и отправляет в `events` файлы, как только у них находится пара по размеру."""
+    # Для каждого размера помним первый файл, пока у него нет пары
+    first_of_size = {}
+
+    def emit(size, path, st):
+        # Ключ кэша (только если кэш открыт) берется из stat, уже сделанного при обходе.
+        # В Windows DirEntry.stat() не заполняет inode, тогда нужен отдельный os.stat
+        key = None
+        if with_keys:
+            if not st.st_ino:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    pass
+            if st.st_ino:
+                key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        # Слот освобождается, когда хэш начала файла готов: одновременно в очереди
+        # и в работе этапа 1 не больше QUEUE_SIZE файлов, обход ждет хэширования
+        slots.acquire()
+        events.put(("walk", None, (size, path, key)))
+
+    try:
+        # os.scandir отдаёт тип записи вместе с содержимым каталога,
+        # поэтому отдельный stat на каждый файл не нужен (а в Windows и размер)
+        stack = [folder]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                    size = st.st_size
+                except OSError:
+                    continue
+                # Файлы вне заданного диапазона размеров пропускаются целиком
+                if size < min_size or (max_size is not None and size > max_size):
+                    continue
+                # Отправляем только потенциальные дубликаты (одинаковый размер)
+                if size not in first_of_size:
+                    first_of_size[size] = (entry.path, st)
+                    continue
+                if first_of_size[size] is not None:
+                    emit(size, *first_of_size[size])
+                    first_of_size[size] = None
+                emit(size, entry.path, st)
+    finally:
+        events.put(("walk_done", None, None))
+
+def open_cache(path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path)
+    # Кэш старого формата (без хэша начала) просто пересоздается
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(h)")]
+    if columns and "head" not in columns:
+        conn.execute("DROP TABLE h")
+    # head - хэш начала файла, hash - полный хэш (NULL, если он еще не понадобился)
+    conn.execute("CREATE TABLE IF NOT EXISTS h (dev INT, ino INT, size INT, mtime_ns INT, head TEXT, hash TEXT, PRIMARY KEY(dev, ino))")
+    return conn
+
+def cache_lookup(cache, key):
+    # Файл считается неизменным, если совпадают устройство, inode, размер и mtime
+    return cache.execute("SELECT head, hash FROM h WHERE dev=? AND ino=? AND size=? AND mtime_ns=?", key).fetchone()
+
+def cache_store(cache, rows):
+    cache.executemany("INSERT OR REPLACE INTO h (dev, ino, size, mtime_ns, head, hash) VALUES (?, ?, ?, ?, ?, ?)", rows)
+    cache.commit()
+
+def print_progress(candidates, heads, hashed):
+    print(f"\rКандидатов: {candidates}, проверено начал: {heads}, полных хэшей: {hashed}", end='', flush=True)
+
+def find_duplicates(folder, cache=None, min_size=0, max_size=None):
+    # Обход, хэш начала и полный хэш работают одновременно: файл уходит на следующий
+    # этап, как только у него появляется пара, а не после обхода всего дерева.
+    # Все результаты стекаются в одну очередь и разбираются в главном потоке.
+    events = queue.Queue()
+    slots = threading.Semaphore(QUEUE_SIZE)
+    walker = threading.Thread(target=group_by_size, args=(folder, events, slots, min_size, max_size, cache is not None), daemon=True)
+
+    head_map = defaultdict(list)
     hash_map = defaultdict(list)
-    total_files = sum(len(g) for g in groups)
-    done = 0
+    small_batch = []
+    new_rows = []
+    pending = 0
+    walking = True
+    candidates = heads = hashed = 0
 
-    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
-        futures = []
-        for group in groups:
-            for file in group:
-                futures.append(executor.submit(md5, file))
+    # Чтение файлов отпускает GIL, поэтому потоков больше, чем ядер:
+    # так у накопителя (особенно NVMe) всегда есть очередь запросов
+    with ThreadPoolExecutor(max_workers=IO_WORKERS) as executor, ProcessPoolExecutor(mp_context=MP_CONTEXT) as proc_pool:
+        def submit(pool, kind, ctx, fn, arg):
+            nonlocal pending
+            future = pool.submit(fn, arg)
+            pending += 1
+            future.add_done_callback(lambda f: events.put((kind, f, ctx)))
 
-        for future in as_completed(futures):
-            done += 1
-            if done % 10 == 0 or done == total_files:
-                print(f"\rОбработка: {int((done / total_files) * 100)}% ({done}/{total_files})", end='', flush=True)
-            filepath, filehash = future.result()
-            if filehash:
-                hash_map[filehash].append(filepath)
+        def request_full_hash(size, file, key, head, cached_hash):
+            if cached_hash:
+                hash_map[cached_hash].append(file)
+            elif size <= SMALL_FILE_SIZE:
+                # Мелкие файлы упираются в накладные расходы интерпретатора и GIL,
+                # поэтому они хэшируются пачками в отдельных процессах
+                small_batch.append((file, (key, head)))
+                if len(small_batch) >= SMALL_BATCH:
+                    submit(proc_pool, "full", [ctx for _, ctx in small_batch], hash_batch, [f for f, _ in small_batch])
+                    small_batch.clear()
+            else:
+                submit(executor, "full", [(key, head)], file_hash_list, file)
 
+        def add_head(size, filepath, key, digest, from_cache, cached_hash=None):
+            # Этап 2: полный хэш только для файлов с совпавшим началом
+            if size <= HEAD_SIZE:
+                # Файл прочитан целиком - хэш начала и есть итоговый хэш
+                hash_map[digest].append(filepath)
+                if key and not from_cache:
+                    new_rows.append((*key, digest, digest))
+                return
+            if key and not from_cache:
+                new_rows.append((*key, digest, None))
+            same_head = head_map[(size, digest)]
+            # Полный хэш из кэша хранится вместе с файлом и понадобится, только если найдется пара
+            same_head.append((filepath, key, cached_hash))
+            if len(same_head) == 2:
+                for file, file_key, file_cached_hash in same_head:
+                    request_full_hash(size, file, file_key, digest, file_cached_hash)
+            elif len(same_head) > 2:
+                request_full_hash(size, filepath, key, digest, cached_hash)
+
+        walker.start()
+        while True:
+            if not walking and not pending:
+                if not small_batch:
+                    break
+                # Неполную последнюю пачку мелких файлов дешевле досчитать в потоках
+                for file, ctx in small_batch:
+                    submit(executor, "full", [ctx], hash_batch, [file])
+                small_batch.clear()
+
+            kind, future, ctx = events.get()
+            if kind == "walk_done":
+                walking = False
+            elif kind == "walk":
+                candidates += 1
+                size, file, key = ctx
+                row = cache_lookup(cache, key) if key else None
+                if row and row[0]:
+                    # Файл не менялся - хэши берутся из кэша, файл не читается вовсе
+                    slots.release()
+                    heads += 1
+                    add_head(size, file, key, row[0], True, row[1])
+                else:
+                    # Этап 1: хэш первых 64 КБ отсеивает большинство файлов одинакового размера
+                    submit(executor, "head", (size, key), head_hash, file)
+            elif kind == "head":
+                pending -= 1
+                heads += 1
+                slots.release()
+                filepath, digest = future.result()
+                if digest:
+                    add_head(ctx[0], filepath, ctx[1], digest, False)
+            elif kind == "full":
+                pending -= 1
+                for (filepath, filehash), (key, head) in zip(future.result(), ctx):
+                    hashed += 1
+                    if filehash:
+                        hash_map[filehash].append(filepath)
+                        if key:
+                            new_rows.append((*key, head, filehash))
+
+            if len(new_rows) >= CACHE_BATCH:
+                cache_store(cache, new_rows)
+                new_rows = []
+
+            if (candidates + heads + hashed) % 10 == 0:
+                print_progress(candidates, heads, hashed)
+
+    if new_rows:
+        cache_store(cache, new_rows)
+    print_progress(candidates, heads, hashed)
     print()
     return {k: v for k, v in hash_map.items() if len(v) > 1}
 
@@ -61,18 +280,41 @@ def save_result(duplicates, output_file):
             f.write("================================\n")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Использование: python find_dupes.py <путь_к_папке> <файл_результата>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Find duplicate files in a folder.")
+    parser.add_argument("folder", help="Folder to scan")
+    parser.add_argument("output", help="File to save the list of duplicate groups to")
+    parser.add_argument(
+        "--cache",
+        default=DEFAULT_CACHE,
+        help=f"Path to the hash cache database (default: {DEFAULT_CACHE})"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or update the hash cache"
+    )
+    parser.add_argument(
+        "--min-size",
+        type=int,
+        default=DEFAULT_MIN_SIZE,
+        help=f"Skip files smaller than this many bytes entirely (default: {DEFAULT_MIN_SIZE}, 0 to include all files)"
+    )
+    parser.add_argument(
+        "--max-size",
+        type=int,
+        default=None,
+        help="Skip files larger than this many bytes entirely (default: no limit)"
+    )
+    args = parser.parse_args()
 
-    folder = sys.argv[1]
-    output = sys.argv[2]
+    folder = args.folder
+    output = args.output
+    cache = None if args.no_cache else open_cache(args.cache)
 
     print(f"Сканирование {folder}...")
-    size_groups = group_by_size(folder)
-    print(f"Найдено {len(size_groups)} групп одинакового размера.")
-
-    duplicates = hash_groups(size_groups)
+    duplicates = find_duplicates(folder, cache, args.min_size, args.max_size)
     save_result(duplicates, output)
+    if cache is not None:
+        cache.close()
 
     print(f"\nНайдено {len(duplicates)} групп дубликатов. Сохранено в {output}")
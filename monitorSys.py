@@ -9,10 +9,17 @@ DEFAULT_LOG_FILE = 'system_monitor.log'
 DEFAULT_INTERVAL_SECONDS = 5 # Default check interval in seconds
 
 # --- Argument Parsing ---
+def positive_float(value):
+    """argparse type: a floating-point number strictly greater than zero."""
+    number = float(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+    return number
+
 parser = argparse.ArgumentParser(description="Monitor CPU and Memory usage and log it.")
 parser.add_argument(
     '-i', '--interval',
-    type=int,
+    type=positive_float,
     default=DEFAULT_INTERVAL_SECONDS,
     help=f"Monitoring interval in seconds (default: {DEFAULT_INTERVAL_SECONDS})"
 )
@@ -48,10 +55,10 @@ if args.verbose:
 # --- Monitoring Function ---
 def get_system_stats():
     """Retrieves current CPU and Memory statistics."""
-    # Get CPU usage percentage (over the specified interval for accuracy)
-    # The first call might return 0.0 or require a non-None interval.
-    # Using interval=1 gives a measurement over 1 second.
-    cpu_usage = psutil.cpu_percent(interval=1)
+    # Get CPU usage percentage since the previous call (non-blocking).
+    # psutil must be primed with one call before the loop so the first
+    # reading is measured over a full interval instead of returning 0.0.
+    cpu_usage = psutil.cpu_percent(interval=None)
 
     # Get memory usage statistics
     memory_info = psutil.virtual_memory()
@@ -73,7 +80,12 @@ def main():
     """Main monitoring loop."""
     logger.info(f"Starting system monitoring. Logging to '{args.logfile}'. Interval: {args.interval} seconds.")
     try:
+        # Prime the CPU counter; each later call reports usage since the previous one
+        psutil.cpu_percent(interval=None)
         while True:
+            # Sleep first so the first sample covers a full interval
+            time.sleep(args.interval)
+
             stats = get_system_stats()
 
             # Format the log message
@@ -87,11 +99,6 @@ def main():
 
             logger.info(log_message)
 
-            # Wait for the next interval, accounting for the 1 second used by cpu_percent
-            # Ensure sleep duration is non-negative
-            sleep_time = max(0, args.interval - 1)
-            time.sleep(sleep_time)
-
     except KeyboardInterrupt:
         logger.info("Monitoring stopped by user (Ctrl+C).")
     except Exception as e:
@@ -2,6 +2,9 @@ import psutil
 import time
 import argparse
 from datetime import datetime
+import numpy as np
+import matplotlib
+matplotlib.use('Agg') # Неинтерактивный бэкенд: график только сохраняется в файл, GUI не загружается
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from collections import defaultdict
@@ -13,16 +16,34 @@ DEFAULT_INTERVAL_SECONDS = 3   # Интервал сбора данных по 
 DEFAULT_TOP_N = 5              # Количество топ-процессов для отображения
 DEFAULT_OUTPUT_PNG = 'top_processes_usage.png'
 
+# Фигура создается один раз и переиспользуется при повторных вызовах create_process_plot
+_figure = None
+_axes = None
+
+def positive_float(value):
+    """Тип для argparse: число с плавающей точкой строго больше нуля."""
+    number = float(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+    return number
+
+def non_negative_int(value):
+    """Тип для argparse: целое число не меньше нуля."""
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must not be negative, got {value}")
+    return number
+
 parser = argparse.ArgumentParser(description="Monitor per-process resource usage and plot the top consumers.")
 parser.add_argument(
     '-d', '--duration',
-    type=int,
+    type=non_negative_int,
     default=DEFAULT_DURATION_SECONDS,
     help=f"Total monitoring duration in seconds (default: {DEFAULT_DURATION_SECONDS})"
 )
 parser.add_argument(
     '-i', '--interval',
-    type=float,
+    type=positive_float,
     default=DEFAULT_INTERVAL_SECONDS,
     help=f"Data collection interval in seconds (default: {DEFAULT_INTERVAL_SECONDS})"
 )
@@ -48,150 +69,164 @@ args = parser.parse_args()
 
 # --- Сбор данных ---
 
+SYSTEM_USERS = ['system', 'root', 'local service', 'network service']
+IDLE_CPU_SECONDS = 0.01 # Процесс, потративший меньше CPU-времени за срез, считается простаивающим
+
+def discover_processes(procs, ignored, include_system=False):
+    """Добавляет в таблицу `procs` процессы, появившиеся с прошлого среза."""
+    for pid in psutil.pids():
+        if pid in procs or pid in ignored:
+            continue
+        try:
+            proc = psutil.Process(pid)
+            with proc.oneshot():
+                # Имя, пользователь и командная строка не меняются - читаем их один раз
+                proc.info = proc.as_dict(['name', 'username', 'cmdline'])
+                cpu_times = proc.cpu_times() # Начальная точка для подсчета загрузки CPU
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            continue
+        # (время среза, суммарное CPU-время, последний RSS в МБ)
+        proc.last_sample = (time.monotonic(), cpu_times.user + cpu_times.system, None)
+
+        # Пропускаем системные процессы, если не указан флаг
+        # PID 0 (System Idle Process on Windows, kernel tasks on Linux) often has weird stats
+        # Пропускаем процессы без имени или пользователя, если они не нужны
+        username = proc.info['username']
+        if pid == 0 or (not include_system and (username is None or username.lower() in SYSTEM_USERS)):
+            if pid != 0 and proc.info['name'] is not None and proc.info['name'].strip() != "": # Keep named system processes if needed later?
+                pass # Could add logic here if needed, for now skip fully
+            else:
+                ignored.add(pid) # Skip PID 0 and unspecified system processes if flag is off
+                continue
+
+        procs[pid] = proc
+
 def collect_process_data(duration_sec, interval_sec, include_system=False):
-    """Собирает данные об использовании CPU и памяти процессами."""
-    data = defaultdict(lambda: {'timestamps': [], 'cpu': [], 'mem_mb': [], 'name': None, 'username': None, 'cmdline': None})
+    """Собирает данные об использовании CPU и памяти процессами.
+
+    Возвращает (sample_times, data): метки времени срезов, общие для всех
+    процессов, и словарь PID -> массивы замеров по тем же индексам срезов.
+    """
+    # Колоночное хранение: массивы NumPy заранее выделяются на все срезы,
+    # `valid` отмечает срезы, в которых процесс действительно был замерен.
+    max_samples = int(duration_sec / interval_sec) + 2
+    sample_times = np.full(max_samples, np.datetime64('NaT'), dtype='datetime64[ms]')
+    data = defaultdict(lambda: {
+        'cpu': np.zeros(max_samples, dtype=np.float32),
+        'mem_mb': np.zeros(max_samples, dtype=np.float32),
+        'valid': np.zeros(max_samples, dtype=bool),
+        'name': None, 'username': None, 'cmdline': None
+    })
     end_time = time.time() + duration_sec
     num_samples = 0
 
-    print(f"Starting data collection for {duration_sec} seconds (interval: {interval_sec}s)...")
+    # Объекты psutil.Process живут между срезами, а не создаются заново
+    # на каждой итерации: так не перечитываются статические атрибуты процессов
+    procs = {}
+    ignored = set()
 
-    # Первый вызов cpu_percent для инициализации (для некоторых систем)
-    try:
-        for proc in psutil.process_iter(['pid']):
-             proc.cpu_percent(interval=None) # Initialize per-process cpu stats
-    except Exception as e:
-        print(f"Warning: Initial cpu_percent call failed for some processes: {e}")
+    print(f"Starting data collection for {duration_sec} seconds (interval: {interval_sec}s)...")
 
+    # Первый проход: заполняем таблицу и запоминаем начальное CPU-время
+    discover_processes(procs, ignored, include_system)
 
-    while time.time() < end_time:
+    while time.time() < end_time and num_samples < max_samples:
         current_time = datetime.now()
+        sample_idx = num_samples
+        sample_times[sample_idx] = current_time
         num_samples += 1
         print(f"\rCollecting sample {num_samples} at {current_time.strftime('%H:%M:%S')}...", end="")
 
-        process_snapshot = {} # Временный словарь для текущего среза
-
-        for proc in psutil.process_iter(['pid', 'name', 'username', 'cpu_percent', 'memory_info', 'cmdline']):
+        for pid, proc in list(procs.items()):
+            last_time, last_cpu_total, mem_mb = proc.last_sample
+            now = time.monotonic()
             try:
-                pid = proc.info['pid']
-
-                # Пропускаем системные процессы, если не указан флаг
-                # PID 0 (System Idle Process on Windows, kernel tasks on Linux) often has weird stats
-                # Пропускаем процессы без имени или пользователя, если они не нужны
-                if pid == 0 or (not include_system and (proc.info['username'] is None or proc.info['username'].lower() in ['system', 'root', 'local service', 'network service'])):
-                     if pid != 0 and proc.info['name'] is not None and proc.info['name'].strip() != "": # Keep named system processes if needed later?
-                        pass # Could add logic here if needed, for now skip fully
-                     else:
-                        continue # Skip PID 0 and unspecified system processes if flag is off
-
-                # Получаем данные (cpu_percent может вернуть None при первом вызове)
-                cpu = proc.info['cpu_percent']
-                mem_rss_bytes = proc.info['memory_info'].rss # Resident Set Size
-                mem_mb = mem_rss_bytes / (1024 * 1024) # Конвертируем в МБ
-
-                # Пропускаем процессы с нулевым потреблением (опционально, для чистоты)
-                # if cpu is None or (cpu == 0 and mem_mb < 0.1): # Порог можно настроить
-                #     continue
-
-                if cpu is None: cpu = 0.0 # Обрабатываем None от первого вызова
-
-                # Сохраняем данные для этого PID в текущем срезе
-                process_snapshot[pid] = {
-                    'cpu': cpu,
-                    'mem_mb': mem_mb,
-                    'name': proc.info['name'],
-                    'username': proc.info['username'],
-                    'cmdline': ' '.join(proc.info['cmdline']) if proc.info['cmdline'] else '' # Объединяем командную строку
-                }
-
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                # Процесс мог завершиться или доступ запрещен
+                # cpu_times() - одна строка /proc/<pid>/stat, это основной дешевый замер
+                cpu_times = proc.cpu_times()
+                cpu_total = cpu_times.user + cpu_times.system
+                # Память перечитываем только у активных процессов,
+                # у простаивающих берем значение с прошлого среза
+                if mem_mb is None or cpu_total - last_cpu_total >= IDLE_CPU_SECONDS:
+                    mem_mb = proc.memory_info().rss / (1024 * 1024) # Resident Set Size, в МБ
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                # Процесс завершился - убираем его из таблицы
+                del procs[pid]
                 continue
-            except Exception as e:
-                # Другие возможные ошибки psutil
-                 # Не будем выводить для каждого процесса, чтобы не засорять лог
-                 # print(f"\nWarning: Could not get info for PID {proc.pid if hasattr(proc, 'pid') else 'N/A'}: {e}")
-                 pass
-
-        # Добавляем данные из текущего среза в основной словарь `data`
-        for pid, stats in process_snapshot.items():
-             # Если это первый раз видим PID, сохраняем имя и пользователя
+            except psutil.AccessDenied:
+                continue
+
+            # Загрузка CPU в процентах, как у cpu_percent(): CPU-время за прошедшее время
+            cpu = (cpu_total - last_cpu_total) / (now - last_time) * 100 if now > last_time else 0.0
+            proc.last_sample = (now, cpu_total, mem_mb)
+
+            # Если это первый раз видим PID, сохраняем имя и пользователя
             if data[pid]['name'] is None:
-                 data[pid]['name'] = stats['name']
-                 data[pid]['username'] = stats['username']
-                 data[pid]['cmdline'] = stats['cmdline']
+                data[pid]['name'] = proc.info['name']
+                data[pid]['username'] = proc.info['username']
+                data[pid]['cmdline'] = ' '.join(proc.info['cmdline']) if proc.info['cmdline'] else '' # Объединяем командную строку
 
-            data[pid]['timestamps'].append(current_time)
-            data[pid]['cpu'].append(stats['cpu'])
-            data[pid]['mem_mb'].append(stats['mem_mb'])
+            data[pid]['cpu'][sample_idx] = cpu
+            data[pid]['mem_mb'][sample_idx] = mem_mb
+            data[pid]['valid'][sample_idx] = True
 
+        # Новые процессы попадут в данные со следующего среза
+        discover_processes(procs, ignored, include_system)
 
         # Ждем до следующего интервала
         time.sleep(interval_sec)
 
     print(f"\nData collection finished. Collected {num_samples} samples for {len(data)} processes.")
-    return data
+    return sample_times, data
 
 # --- Анализ данных и определение Топ-N ---
 
+def top_indices(values, top_n):
+    """Возвращает индексы `top_n` наибольших значений, упорядоченные по убыванию."""
+    top_n = min(top_n, len(values))
+    if top_n <= 0:
+        return np.array([], dtype=int)
+    # partition находит порог топа за O(N), сортируются только отобранные элементы
+    threshold = np.partition(values, -top_n)[-top_n]
+    above = np.flatnonzero(values > threshold)
+    # Из равных порогу берем первые по порядку, как sorted(..., reverse=True)
+    ties = np.flatnonzero(values == threshold)[:top_n - len(above)]
+    idx = np.sort(np.concatenate([above, ties]))
+    return idx[np.argsort(-values[idx], kind='stable')]
+
 def analyze_data(data, top_n):
     """Анализирует собранные данные и определяет топ N потребителей."""
     if not data:
-        return None, None, None
-
-    process_summary = defaultdict(lambda: {'total_cpu': 0, 'total_mem': 0, 'count': 0, 'name': None, 'username': None, 'cmdline': None, 'pid': None})
-
-    # Суммируем показатели для каждого PID
-    for pid, stats in data.items():
-        if not stats['cpu'] or not stats['mem_mb']: # Пропускаем, если нет данных
-             continue
-        process_summary[pid]['total_cpu'] = sum(stats['cpu'])
-        process_summary[pid]['total_mem'] = sum(stats['mem_mb'])
-        process_summary[pid]['count'] = len(stats['timestamps'])
-        process_summary[pid]['name'] = stats['name']
-        process_summary[pid]['username'] = stats['username']
-        process_summary[pid]['cmdline'] = stats['cmdline']
-        process_summary[pid]['pid'] = pid # Сохраняем PID для идентификации
-
-    # Рассчитываем средние значения и создаем список для сортировки
-    average_stats = []
-    for pid, summary in process_summary.items():
-        if summary['count'] > 0:
-            avg_cpu = summary['total_cpu'] / summary['count']
-            avg_mem = summary['total_mem'] / summary['count']
-            # Создаем уникальный идентификатор процесса (имя + cmdline или PID)
-            proc_id_str = f"{summary['name']} ({pid})"
-            # Можно усложнить, если cmdline нужен для различения одинаковых имен:
-            # cmd_short = (summary['cmdline'][:30] + '...') if summary['cmdline'] and len(summary['cmdline']) > 30 else summary['cmdline']
-            # proc_id_str = f"{summary['name']} [{cmd_short}] ({pid})"
-
-            average_stats.append({
-                'pid': pid,
-                'id_str': proc_id_str,
-                'avg_cpu': avg_cpu,
-                'avg_mem': avg_mem
-            })
-
-    # Сортируем процессы
-    top_cpu_consumers = sorted(average_stats, key=lambda x: x['avg_cpu'], reverse=True)
-    top_mem_consumers = sorted(average_stats, key=lambda x: x['avg_mem'], reverse=True)
-
-    # Выбираем топ N PIDs для каждого ресурса
-    top_cpu_pids = [p['pid'] for p in top_cpu_consumers[:top_n]]
-    top_mem_pids = [p['pid'] for p in top_mem_consumers[:top_n]]
-
-    # Получаем их идентификаторы для легенды
-    top_cpu_ids = {p['pid']: p['id_str'] for p in top_cpu_consumers[:top_n]}
-    top_mem_ids = {p['pid']: p['id_str'] for p in top_mem_consumers[:top_n]}
+        return None, None, None, None
+
+    # Пропускаем процессы, для которых нет ни одного замера
+    pids = np.array([pid for pid, stats in data.items() if stats['valid'].any()], dtype=np.int64)
+
+    # Средние значения считаются редукциями NumPy по маске `valid`
+    avg_cpu = np.fromiter((data[pid]['cpu'][data[pid]['valid']].mean() for pid in pids), dtype=np.float32, count=len(pids))
+    avg_mem = np.fromiter((data[pid]['mem_mb'][data[pid]['valid']].mean() for pid in pids), dtype=np.float32, count=len(pids))
+
+    # Выбираем топ N для каждого ресурса
+    top_cpu_idx = top_indices(avg_cpu, top_n)
+    top_mem_idx = top_indices(avg_mem, top_n)
+
+    top_cpu_pids = [int(pids[i]) for i in top_cpu_idx]
+    top_mem_pids = [int(pids[i]) for i in top_mem_idx]
+
+    # Создаем уникальный идентификатор процесса (имя + PID) для легенды
+    # Можно усложнить, если cmdline нужен для различения одинаковых имен:
+    # cmd_short = (cmdline[:30] + '...') if cmdline and len(cmdline) > 30 else cmdline
+    # proc_id_str = f"{name} [{cmd_short}] ({pid})"
+    top_cpu_ids = {pid: f"{data[pid]['name']} ({pid})" for pid in top_cpu_pids}
+    top_mem_ids = {pid: f"{data[pid]['name']} ({pid})" for pid in top_mem_pids}
 
 
     print("\nTop CPU Consumers (Average):")
-    for p in top_cpu_consumers[:top_n]:
-        print(f"  - {p['id_str']}: {p['avg_cpu']:.2f}%")
+    for pid, i in zip(top_cpu_pids, top_cpu_idx):
+        print(f"  - {top_cpu_ids[pid]}: {avg_cpu[i]:.2f}%")
 
     print("\nTop Memory Consumers (Average RSS):")
-    for p in top_mem_consumers[:top_n]:
-        print(f"  - {p['id_str']}: {p['avg_mem']:.2f} MB")
+    for pid, i in zip(top_mem_pids, top_mem_idx):
+        print(f"  - {top_mem_ids[pid]}: {avg_mem[i]:.2f} MB")
 
 
     return top_cpu_pids, top_mem_pids, top_cpu_ids, top_mem_ids
@@ -199,7 +234,7 @@ def analyze_data(data, top_n):
 
 # --- Построение графика ---
 
-def create_process_plot(data, top_cpu_pids, top_mem_pids, top_cpu_ids, top_mem_ids, output_png_filepath):
+def create_process_plot(sample_times, data, top_cpu_pids, top_mem_pids, top_cpu_ids, top_mem_ids, output_png_filepath):
     """Создает график с двумя под-графиками для CPU и Памяти топ-N процессов."""
     if not top_cpu_pids and not top_mem_pids:
         print("Error: No top consumers identified to plot.")
@@ -208,14 +243,24 @@ def create_process_plot(data, top_cpu_pids, top_mem_pids, top_cpu_ids, top_mem_i
     print(f"\nCreating plot and saving to {output_png_filepath}...")
 
     # Создаем фигуру с двумя под-графиками (один над другим)
-    fig, axes = plt.subplots(2, 1, figsize=(15, 12), sharex=True) # sharex=True связывает оси X
+    global _figure, _axes
+    if _figure is None:
+        _figure, _axes = plt.subplots(2, 1, figsize=(15, 12), sharex=True) # sharex=True связывает оси X
+    else:
+        for ax in _axes:
+            ax.clear() # Очищаем оси вместо создания новой фигуры
+    fig, axes = _figure, _axes
+
+    # Метки времени общие для всех процессов - переводим их в числа дат matplotlib один раз
+    sample_x = mdates.date2num(sample_times)
 
     # --- График CPU ---
     ax_cpu = axes[0]
     for pid in top_cpu_pids:
-        if pid in data and data[pid]['timestamps']:
+        if pid in data and data[pid]['valid'].any():
+            valid = data[pid]['valid']
             label = top_cpu_ids.get(pid, f"PID {pid}") # Используем сохраненный ID
-            ax_cpu.plot(data[pid]['timestamps'], data[pid]['cpu'], label=label, linewidth=1.5, marker='.', markersize=4, alpha=0.8)
+            ax_cpu.plot(sample_x[valid], data[pid]['cpu'][valid], label=label, linewidth=1.5, marker='.', markersize=4, alpha=0.8)
 
     ax_cpu.set_title(f'Top {len(top_cpu_pids)} CPU Consuming Processes (Usage %)')
     ax_cpu.set_ylabel('CPU Usage (%)')
@@ -226,9 +271,10 @@ def create_process_plot(data, top_cpu_pids, top_mem_pids, top_cpu_ids, top_mem_i
     # --- График Памяти (RSS) ---
     ax_mem = axes[1]
     for pid in top_mem_pids:
-         if pid in data and data[pid]['timestamps']:
+         if pid in data and data[pid]['valid'].any():
+            valid = data[pid]['valid']
             label = top_mem_ids.get(pid, f"PID {pid}") # Используем сохраненный ID
-            ax_mem.plot(data[pid]['timestamps'], data[pid]['mem_mb'], label=label, linewidth=1.5, marker='.', markersize=4, alpha=0.8)
+            ax_mem.plot(sample_x[valid], data[pid]['mem_mb'][valid], label=label, linewidth=1.5, marker='.', markersize=4, alpha=0.8)
 
     ax_mem.set_title(f'Top {len(top_mem_pids)} Memory Consuming Processes (RSS MB)')
     ax_mem.set_ylabel('Memory Usage (MB)')
@@ -242,28 +288,27 @@ def create_process_plot(data, top_cpu_pids, top_mem_pids, top_cpu_ids, top_mem_i
     ax_mem.xaxis.set_major_formatter(mdates.DateFormatter('%d %b %H:%M:%S')) # Формат как в предыдущем запросе + секунды
 
     fig.autofmt_xdate() # Автоматический наклон меток времени
-    plt.tight_layout(rect=[0, 0.03, 1, 0.98]) # Улучшаем расположение, оставляем место для заголовка фигуры
+    fig.tight_layout(rect=[0, 0.03, 1, 0.98]) # Улучшаем расположение, оставляем место для заголовка фигуры
 
     # Общий заголовок (опционально)
     # fig.suptitle('System Resource Usage by Top Processes', fontsize=16)
 
     # Сохраняем график
     try:
-        plt.savefig(output_png_filepath, dpi=150)
+        fig.savefig(output_png_filepath, dpi=150)
         print(f"Plot successfully saved to '{output_png_filepath}'")
     except Exception as e:
         print(f"Error saving plot to '{output_png_filepath}': {e}")
 
-    # plt.show() # Раскомментируйте для отображения
-    plt.close(fig) # Закрываем фигуру
+    # Фигура не закрывается: следующий вызов create_process_plot нарисует в ней заново
 
 # --- Основной блок ---
 if __name__ == "__main__":
-    collected_data = collect_process_data(args.duration, args.interval, args.include_system_procs)
+    sample_times, collected_data = collect_process_data(args.duration, args.interval, args.include_system_procs)
     if collected_data:
         top_cpu_pids, top_mem_pids, top_cpu_ids, top_mem_ids = analyze_data(collected_data, args.top_n)
         if top_cpu_pids or top_mem_pids: # Если есть хотя бы один список топ-процессов
-             create_process_plot(collected_data, top_cpu_pids, top_mem_pids, top_cpu_ids, top_mem_ids, args.output_png)
+             create_process_plot(sample_times, collected_data, top_cpu_pids, top_mem_pids, top_cpu_ids, top_mem_ids, args.output_png)
         else:
             print("Could not identify any top processes based on collected data.")
     else:
@@ -1,6 +1,10 @@
+import os
 import re
+import mmap
 import argparse
-from datetime import datetime
+import numpy as np
+import matplotlib
+matplotlib.use('Agg') # Неинтерактивный бэкенд: график только сохраняется в файл, GUI не загружается
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates # Для форматирования дат на оси X
 
@@ -8,6 +12,10 @@ import matplotlib.dates as mdates # Для форматирования дат 
 DEFAULT_LOG_FILE = 'system_monitor.log'
 DEFAULT_OUTPUT_PNG = 'system_usage_plot.png'
 
+# Фигура создается один раз и переиспользуется при повторных вызовах create_plot
+_figure = None
+_axes = None
+
 # --- Парсинг аргументов командной строки ---
 parser = argparse.ArgumentParser(description="Parse system monitor log file and create a usage plot.")
 parser.add_argument(
@@ -26,46 +34,30 @@ args = parser.parse_args()
 
 # --- Функция парсинга лог-файла ---
 def parse_log_file(log_filepath):
-    """Читает лог-файл и извлекает временные метки, данные CPU и памяти."""
-    timestamps = []
-    cpu_percentages = []
-    memory_percentages = []
-
+    """Читает лог-файл и извлекает временные метки, данные CPU и памяти в виде массивов NumPy."""
     # Регулярное выражение для извлечения данных из строки лога
     # Формат: ГГГГ-ММ-ДД ЧЧ:ММ:СС - INFO - CPU Usage: XX.X% | Memory Usage: YY.Y% ...
     # Захватываем: (метка времени), (CPU %), (Memory %)
+    # Шаблон привязан к началу строки (^ + MULTILINE): для остальных позиций
+    # в тексте поиск отбрасывается сразу, без попыток сопоставления
     log_pattern = re.compile(
-        r"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) - INFO - "
-        r"CPU Usage: (\d+\.\d+)% \| "
-        r"Memory Usage: (\d+\.\d+)%"
+        rb"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) - INFO - "
+        rb"CPU Usage: (\d+\.\d+)% \| "
+        rb"Memory Usage: (\d+\.\d+)%",
         # r".*" # Остальная часть строки нас не интересует для графика
+        re.MULTILINE
     )
 
     print(f"Parsing log file: {log_filepath}...")
     try:
-        with open(log_filepath, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                match = log_pattern.search(line)
-                if match:
-                    try:
-                        timestamp_str, cpu_str, memory_str = match.groups()
-                        # Преобразуем строку времени в объект datetime
-                        timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-                        # Преобразуем строки процентов в числа float
-                        cpu_percent = float(cpu_str)
-                        memory_percent = float(memory_str)
-
-                        timestamps.append(timestamp)
-                        cpu_percentages.append(cpu_percent)
-                        memory_percentages.append(memory_percent)
-                    except ValueError as e:
-                        print(f"Warning: Could not parse data on line {line_num}: {e}. Line: '{line.strip()}'")
-                    except Exception as e:
-                        print(f"Warning: An unexpected error occurred parsing line {line_num}: {e}. Line: '{line.strip()}'")
-                # else:
-                #     # Можно добавить вывод предупреждения о строках, не соответствующих шаблону, если нужно
-                #     if line.strip() and "monitoring script started" not in line and "monitoring script finished" not in line and "Monitoring stopped" not in line:
-                #          print(f"Warning: Line {line_num} did not match expected format: '{line.strip()}'")
+        # Один проход регулярного выражения по отображенному в память файлу:
+        # без построчного чтения и декодирования текста
+        with open(log_filepath, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                matches = [] # Пустой файл нельзя отобразить в память
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    matches = log_pattern.findall(mm)
     except FileNotFoundError:
         print(f"Error: Log file not found at '{log_filepath}'")
         return None, None, None
@@ -73,52 +65,82 @@ def parse_log_file(log_filepath):
         print(f"Error reading log file '{log_filepath}': {e}")
         return None, None, None
 
+    # Пакетное преобразование строк в массивы: даты и числа разбираются в C, а не построчно
+    fields = np.array(matches, dtype=bytes).reshape(-1, 3)
+    # Даты приводятся к datetime64 через str: приведение bytes с некорректной
+    # датой в NumPy может завершиться segfault вместо ValueError
+    timestamp_strs = fields[:, 0].astype('U19')
+    try:
+        timestamps = timestamp_strs.astype('datetime64[s]')
+    except ValueError:
+        # Есть некорректная дата (например, 30 февраля) - разбираем построчно
+        # и пропускаем только плохие строки
+        timestamps = np.empty(len(fields), dtype='datetime64[s]')
+        valid = np.ones(len(fields), dtype=bool)
+        for i, timestamp_str in enumerate(timestamp_strs):
+            try:
+                timestamps[i] = np.datetime64(timestamp_str, 's')
+            except ValueError as e:
+                valid[i] = False
+                entry = f"{timestamp_str} - INFO - CPU Usage: {fields[i, 1].decode()}% | Memory Usage: {fields[i, 2].decode()}%"
+                print(f"Warning: Could not parse data in entry {i + 1}: {e}. Entry: '{entry}'")
+        timestamps = timestamps[valid]
+        fields = fields[valid]
+    cpu_percentages = fields[:, 1].astype(np.float32)
+    memory_percentages = fields[:, 2].astype(np.float32)
+
     print(f"Parsing complete. Found {len(timestamps)} valid data points.")
     return timestamps, cpu_percentages, memory_percentages
 
 # --- Функция создания и сохранения графика ---
 def create_plot(timestamps, cpu_percentages, memory_percentages, output_png_filepath):
     """Создает график CPU и Memory Usage и сохраняет его в PNG."""
-    if not timestamps or not cpu_percentages or not memory_percentages:
+    if len(timestamps) == 0 or len(cpu_percentages) == 0 or len(memory_percentages) == 0:
         print("Error: No valid data found to plot.")
         return
 
     print(f"Creating plot and saving to {output_png_filepath}...")
 
-    plt.figure(figsize=(15, 7)) # Задаем размер графика для лучшей читаемости
+    global _figure, _axes
+    if _figure is None:
+        _figure, _axes = plt.subplots(figsize=(15, 7)) # Задаем размер графика для лучшей читаемости
+    else:
+        _axes.clear() # Очищаем оси вместо создания новой фигуры
+    fig, ax = _figure, _axes
+
+    # Переводим метки времени в числа дат matplotlib один раз для всех линий
+    x = mdates.date2num(timestamps)
 
     # Строим графики
-    plt.plot(timestamps, cpu_percentages, label='CPU Usage (%)', color='blue', linewidth=1.5)
-    plt.plot(timestamps, memory_percentages, label='Memory Usage (%)', color='red', linewidth=1.5)
+    ax.plot(x, cpu_percentages, label='CPU Usage (%)', color='blue', linewidth=1.5)
+    ax.plot(x, memory_percentages, label='Memory Usage (%)', color='red', linewidth=1.5)
 
     # Настраиваем оси и заголовок
-    plt.xlabel('Time')
-    plt.ylabel('Usage (%)')
-    plt.title('System CPU and Memory Usage Over Time')
-    plt.ylim(0, 105) # Устанавливаем предел оси Y от 0 до 105% (чтобы видеть пики до 100%)
-    plt.grid(True, linestyle='--', alpha=0.6) # Добавляем сетку
-    plt.legend() # Показываем легенду (метки линий)
+    ax.set_xlabel('Time')
+    ax.set_ylabel('Usage (%)')
+    ax.set_title('System CPU and Memory Usage Over Time')
+    ax.set_ylim(0, 105) # Устанавливаем предел оси Y от 0 до 105% (чтобы видеть пики до 100%)
+    ax.grid(True, linestyle='--', alpha=0.6) # Добавляем сетку
+    ax.legend() # Показываем легенду (метки линий)
 
     # Улучшаем форматирование дат на оси X
-    ax = plt.gca() # Получаем текущие оси
     # Устанавливаем основной форматтер и локатор
     ax.xaxis.set_major_locator(mdates.AutoDateLocator(minticks=5, maxticks=10)) # Автоматический выбор интервалов дат
     ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d %H:%M')) # Формат даты/времени
 
-    plt.gcf().autofmt_xdate() # Автоматически наклоняем и выравниваем метки дат
+    fig.autofmt_xdate() # Автоматически наклоняем и выравниваем метки дат
 
     # Сохраняем график в файл PNG
     try:
-        plt.savefig(output_png_filepath, dpi=150, bbox_inches='tight') # dpi - разрешение, bbox_inches - обрезка по содержимому
+        fig.savefig(output_png_filepath, dpi=150, bbox_inches='tight') # dpi - разрешение, bbox_inches - обрезка по содержимому
         print(f"Plot successfully saved to '{output_png_filepath}'")
     except Exception as e:
         print(f"Error saving plot to '{output_png_filepath}': {e}")
 
-    # plt.show() # Раскомментируйте, если хотите также показать график на экране
-    plt.close() # Закрываем фигуру, чтобы освободить память
+    # Фигура не закрывается: следующий вызов create_plot нарисует в ней заново
 
 # --- Основной блок выполнения ---
 if __name__ == "__main__":
     timestamps, cpu_data, mem_data = parse_log_file(args.log_file)
-    if timestamps: # Проверяем, что парсинг прошел успешно и есть данные
+    if timestamps is not None and len(timestamps) > 0: # Проверяем, что парсинг прошел успешно и есть данные
         create_plot(timestamps, cpu_data, mem_data, args.output_png)
\ No newline at end of file